@@ -3,7 +3,7 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from database import get_session, get_or_create_preferences, UserPreferences, Product, AlertSent
+from database import SessionLocal, get_or_create_preferences, UserPreferences, Product, AlertSent
 from services.deal_service import (
     get_deals_from_db, 
     get_data_freshness, 
@@ -182,8 +182,7 @@ async def addbrands_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     unknown_brands = []
     suggestions_for_unknown = {}  # brand -> [suggestions]
 
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         prefs = session.query(UserPreferences).filter(
             UserPreferences.chat_id == chat_id
         ).first()
@@ -192,13 +191,12 @@ async def addbrands_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             prefs = UserPreferences(chat_id=chat_id)
             session.add(prefs)
 
+        # Build a lowercase lookup for known brands once, not per input
+        brand_lookup = {b.lower(): b for b in AVAILABLE_BRANDS}
+
         for brand in brand_inputs:
             # Check exact match (case-insensitive)
-            matched_brand = None
-            for known in AVAILABLE_BRANDS:
-                if known.lower() == brand.lower():
-                    matched_brand = known
-                    break
+            matched_brand = brand_lookup.get(brand.lower())
 
             # Try fuzzy matching if no exact match
             if not matched_brand:
@@ -282,8 +280,6 @@ async def addbrands_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Set /setmaxprice first to see deals!",
                 parse_mode="Markdown"
             )
-    finally:
-        session.close()
 
 
 async def addbrand_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -298,8 +294,7 @@ async def addbrand_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     brand = data[len("addbrand:"):]
     chat_id = str(update.effective_chat.id)
 
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         prefs = session.query(UserPreferences).filter(
             UserPreferences.chat_id == chat_id
         ).first()
@@ -332,8 +327,6 @@ async def addbrand_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         )
         else:
             await query.edit_message_text(f"ℹ️ Already watching: {brand}")
-    finally:
-        session.close()
 
 async def removebrands_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /removebrands command (and alias /removebrand)."""
@@ -358,8 +351,7 @@ async def removebrands_command(update: Update, context: ContextTypes.DEFAULT_TYP
         else:
              brands_to_remove = input_text.split()
 
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         prefs = session.query(UserPreferences).filter(
             UserPreferences.chat_id == chat_id
         ).first()
@@ -406,8 +398,6 @@ async def removebrands_command(update: Update, context: ContextTypes.DEFAULT_TYP
             
         await update.message.reply_text("\n\n".join(msg_parts), parse_mode="Markdown")
 
-    finally:
-        session.close()
 
 async def listbrands_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /listbrands command."""
@@ -448,8 +438,7 @@ async def setmaxprice_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     value = context.args[0].lower()
 
     if value in ("off", "none", "disable", "clear"):
-        session = get_session()
-        try:
+        with SessionLocal() as session:
             prefs = session.query(UserPreferences).filter(
                 UserPreferences.chat_id == chat_id
             ).first()
@@ -464,8 +453,6 @@ async def setmaxprice_command(update: Update, context: ContextTypes.DEFAULT_TYPE
                 "You'll receive alerts regardless of price per kg.",
                 parse_mode="Markdown"
             )
-        finally:
-            session.close()
         return
 
     try:
@@ -486,8 +473,7 @@ async def setmaxprice_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
 
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         prefs = session.query(UserPreferences).filter(
             UserPreferences.chat_id == chat_id
         ).first()
@@ -526,16 +512,13 @@ async def setmaxprice_command(update: Update, context: ContextTypes.DEFAULT_TYPE
                 parse_mode="Markdown"
             )
 
-    finally:
-        session.close()
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status command."""
     chat_id = str(update.effective_chat.id)
     prefs = get_or_create_preferences(chat_id)
 
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         user_alert_count = session.query(AlertSent).filter(AlertSent.chat_id == chat_id).count()
 
         brands = prefs.get_brands_list()
@@ -560,8 +543,6 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg += f"Data updated: {freshness}\n\n"
         msg += "Use /reset to get all current deals again."
         await update.message.reply_text(msg, parse_mode="Markdown")
-    finally:
-        session.close()
 
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /reset command."""
@@ -576,8 +557,7 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         deleted = session.query(AlertSent).filter(AlertSent.chat_id == chat_id).delete()
         session.commit()
 
@@ -594,7 +574,8 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         cheapest_deals = find_cheapest_variants(deals)
         sent_count = 0
-        
+        alerts = []
+
         for product, price, ppkg, other_sites in cheapest_deals:
             try:
                 message = format_cheapest_variant_alert(product, price, prefs.max_price_per_kg, other_sites)
@@ -604,14 +585,12 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     disable_web_page_preview=False
                 )
 
-                alert = AlertSent(
+                alerts.append(AlertSent(
                     product_id=product.id,
                     match_key=product.match_key,
                     price_at_alert=price.current_price,
                     chat_id=chat_id
-                )
-                session.add(alert)
-                session.commit()
+                ))
                 sent_count += 1
 
                 if sent_count >= 30:
@@ -619,6 +598,15 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception as e:
                 logger.error(f"Failed to send reset alert: {e}")
 
+        # Record all sent alerts in a single transaction
+        if alerts:
+            try:
+                session.add_all(alerts)
+                session.commit()
+            except Exception as e:
+                logger.error(f"Failed to record reset alerts: {e}")
+                session.rollback()
+
         if sent_count == 0:
             await update.message.reply_text("No deals found matching your settings.")
         else:
@@ -627,11 +615,15 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(f"Sent {sent_count} alerts. {remaining} more available.")
             else:
                 await update.message.reply_text(f"Sent {sent_count} alert(s)!")
-    finally:
-        session.close()
 
 async def scrape_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /scrape command."""
+    from tracker import is_check_running
+
+    if is_check_running():
+        await update.message.reply_text("🔄 A scrape is already running. Results will arrive as alerts.")
+        return
+
     await update.message.reply_text(
         "🔄 Starting full scrape of all sites (Zooplus, Bitiba, Zooroyal, Fressnapf, Zoo24)...\n"
         "This may take a few minutes."
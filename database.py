@@ -1,7 +1,13 @@
 import re
 from datetime import datetime
+from functools import cached_property
+from typing import Optional
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, joinedload
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, func
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index, func, inspect, text
 
 from config import settings
 
@@ -54,8 +60,68 @@ def generate_match_key(brand: str, size: str, name: str = None) -> str:
 
     return f"{brand_norm}|{size_norm}"
 
-engine = create_engine(settings.database_url, echo=False)
+
+def compute_discount_percent(original_price: Optional[float], current_price: float) -> float:
+    """Percentage off the original price (0.0 when there is no lower current price)."""
+    if original_price and original_price > current_price:
+        return ((original_price - current_price) / original_price) * 100
+    return 0.0
+
+
+class utcnow(FunctionElement):
+    """Current UTC time computed by the database, as a naive timestamp (like datetime.utcnow())."""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _compile_utcnow(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "postgresql")
+def _compile_utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+# One pooled engine per process; sessions check connections out and back in
+engine = create_engine(
+    settings.database_url,
+    echo=False,
+    pool_size=10,
+    max_overflow=20,
+    # No per-checkout SELECT 1; connections older than the recycle time are replaced instead
+    pool_pre_ping=False,
+    pool_recycle=1800
+)
 SessionLocal = sessionmaker(bind=engine)
+
+
+# asyncio driver used for each supported backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def _async_database_url(url: str) -> URL:
+    """Map the configured database URL to its asyncio driver (aiosqlite / asyncpg).
+
+    Any sync driver in the URL (e.g. postgresql+psycopg2, sqlite+pysqlite) is replaced.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url
+
+
+# Same database through an asyncio driver, for DB work done on the event loop
+async_engine = create_async_engine(
+    _async_database_url(settings.database_url),
+    echo=False,
+    pool_pre_ping=False,
+    pool_recycle=1800
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -72,8 +138,8 @@ class Product(Base):
     url = Column(String, nullable=False)
     site = Column(String, default="zooplus")  # For future multi-site support
     is_wet_food = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=utcnow())
 
     prices = relationship("PriceHistory", back_populates="product")
 
@@ -88,6 +154,11 @@ class Product(Base):
 
 class PriceHistory(Base):
     __tablename__ = "price_history"
+    __table_args__ = (
+        # Latest-price-per-product lookups (ordered by recorded_at within each product);
+        # current_price is included so historical averages are answered from the index alone
+        Index("ix_price_history_product_recorded_price", "product_id", "recorded_at", "current_price"),
+    )
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -97,15 +168,15 @@ class PriceHistory(Base):
     sale_tag = Column(String)  # e.g., "Angebot", "-20%"
     original_price_per_kg = Column(Float)  # Original price per kg (before discount)
     reduced_price_per_kg = Column(Float)  # Reduced price per kg (after discount)
-    recorded_at = Column(DateTime, default=datetime.utcnow)
+    # Reduced price per kg if known, else original; set at write time for price-ceiling lookups
+    effective_price_per_kg = Column(Float, index=True)
+    recorded_at = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
 
     product = relationship("Product", back_populates="prices")
 
     @property
     def discount_percent(self) -> float:
-        if self.original_price and self.original_price > self.current_price:
-            return ((self.original_price - self.current_price) / self.original_price) * 100
-        return 0.0
+        return compute_discount_percent(self.original_price, self.current_price)
 
     def __repr__(self):
         return f"<PriceHistory {self.current_price}€ (was {self.original_price}€)>"
@@ -167,6 +238,8 @@ class UserPreferences(Base):
         """Legacy setter - do not use for new code. Use add_brand/remove_brand."""
         # This keeps the legacy field in sync for now, but really we should use the relationship
         self.watched_brands = ",".join(brands)
+        # Watched brands changed; drop the cached normalized list
+        self.__dict__.pop("normalized_brands", None)
 
     def add_brand(self, brand: str) -> bool:
         """Add a brand to watch list. Returns True if added, False if already exists."""
@@ -217,36 +290,59 @@ class UserPreferences(Base):
         normalized = normalized.replace("`", "'")  # backtick
         return normalized
 
+    @cached_property
+    def normalized_brands(self) -> tuple[str, ...]:
+        """Watched brands, normalized once per instance (cleared when the list changes)."""
+        return tuple(self.normalize_brand(b) for b in self.get_brands_list())
+
     def should_notify_for_brand(self, brand: str) -> bool:
         """Check if we should notify for this brand."""
         if not brand:
             return False
-        brands = self.get_brands_list()
         brand_normalized = self.normalize_brand(brand)
-        for b in brands:
-            b_normalized = self.normalize_brand(b)
+        for b_normalized in self.normalized_brands:
             # Exact match or partial match (e.g., "mac's" matches "MAC's Cat")
             if b_normalized == brand_normalized or b_normalized in brand_normalized or brand_normalized in b_normalized:
                 return True
         return False
 
 
+def _add_missing_columns() -> set[tuple[str, str]]:
+    """Add columns that were introduced after their table was created. Returns (table, column) pairs added."""
+    inspector = inspect(engine)
+    added = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                added.add((table.name, column.name))
+
+        if ("price_history", "effective_price_per_kg") in added:
+            # Backfill historical rows
+            conn.execute(text(
+                "UPDATE price_history "
+                "SET effective_price_per_kg = COALESCE(reduced_price_per_kg, original_price_per_kg)"
+            ))
+    return added
+
+
+# Indexes replaced by later schema changes; dropped from existing databases
 def init_db():
-    """Create all tables."""
+    """Create all tables, plus any columns and indexes added to tables that already exist."""
     Base.metadata.create_all(engine)
-
-
-def get_session():
-    """Get a database session."""
-    return SessionLocal()
-
-
+    _add_missing_columns()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 
 def get_or_create_preferences(chat_id: str) -> UserPreferences:
     """Get or create user preferences for a chat ID."""
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         prefs = session.query(UserPreferences).options(joinedload(UserPreferences.brands)).filter(
             UserPreferences.chat_id == chat_id
         ).first()
@@ -261,14 +357,11 @@ def get_or_create_preferences(chat_id: str) -> UserPreferences:
             ).first()
 
         return prefs
-    finally:
-        session.close()
 
 
 def update_preferences(chat_id: str, **kwargs) -> UserPreferences:
     """Update user preferences."""
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         prefs = session.query(UserPreferences).filter(
             UserPreferences.chat_id == chat_id
         ).first()
@@ -284,8 +377,6 @@ def update_preferences(chat_id: str, **kwargs) -> UserPreferences:
         session.commit()
         session.refresh(prefs)
         return prefs
-    finally:
-        session.close()
 
 
 if __name__ == "__main__":
@@ -294,8 +385,7 @@ if __name__ == "__main__":
 
 def get_product_statistics() -> list[dict]:
     """Get product counts grouped by site and brand."""
-    session = get_session()
-    try:
+    with SessionLocal() as session:
         stats = session.query(
             Product.site, 
             Product.brand, 
@@ -306,5 +396,3 @@ def get_product_statistics() -> list[dict]:
             {"site": site, "brand": brand, "count": count}
             for site, brand, count in stats
         ]
-    finally:
-        session.close()
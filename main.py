@@ -13,10 +13,11 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 from config import settings
-from database import init_db
-from database import init_db
+from database import init_db, async_engine
 from tracker import run_check, cleanup_old_offers
 from bot.application import create_bot_application, send_test_message
+from services.alert_service import shutdown_bot
+from scraper import shutdown_browser
 
 logging.basicConfig(
     level=logging.INFO,
@@ -109,6 +110,9 @@ async def run_bot_and_scheduler():
             await app.stop()
             await app.shutdown()
             scheduler.shutdown()
+            await shutdown_bot()
+            await shutdown_browser()
+            await async_engine.dispose()
     else:
         # Run without bot, just scheduler
         logger.info("Running in scheduler-only mode (no bot token)")
@@ -119,12 +123,24 @@ async def run_bot_and_scheduler():
             pass
         finally:
             scheduler.shutdown()
+            await shutdown_bot()
+            await shutdown_browser()
+            await async_engine.dispose()
 
 
 def run_once():
     """Run a single price check (useful for testing)."""
     init_db()
-    asyncio.run(run_check())
+
+    async def _run():
+        try:
+            await run_check()
+        finally:
+            await shutdown_bot()
+            await shutdown_browser()
+            await async_engine.dispose()
+
+    asyncio.run(_run())
 
 
 def test_telegram():
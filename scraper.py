@@ -5,11 +5,12 @@ import logging
 import asyncio
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 from urllib.parse import urljoin, urlparse, parse_qs, quote
 
 from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from typing import AsyncGenerator, Callable
 
 
@@ -17,8 +18,11 @@ from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Only build the parse tree for Zoo24 product cards (skips nav, footer, etc.)
+ZOO24_CARD_STRAINER = SoupStrainer('product-card')
 
-@dataclass
+
+@dataclass(slots=True)
 class ScrapedProduct:
     """Represents a product scraped from a website."""
     external_id: str
@@ -36,6 +40,11 @@ class ScrapedProduct:
     reduced_price_per_kg: Optional[float] = None  # Reduced price per kg (after discount)
     base_product_id: Optional[str] = None  # Base product ID for variant grouping (e.g., "564091")
     variant_name: Optional[str] = None  # Variant descriptor (e.g., "Chicken", "Beef")
+    normalized_brand: Optional[str] = None  # Brand normalized for matching (derived from brand)
+
+    def __post_init__(self):
+        if self.normalized_brand is None and self.brand:
+            self.normalized_brand = BaseScraper.normalize_brand(self.brand)
 
 
 class BaseScraper(ABC):
@@ -103,6 +112,43 @@ class BaseScraper(ABC):
         "filet", "schale", "frischebeutel", "multipack",
     ]
 
+    # Pages larger than this (in characters) are parsed in a worker thread;
+    # smaller ones are parsed inline since the thread hand-off costs more
+    INLINE_PARSE_MAX_HTML = 200_000
+
+    def __init__(self, browser=None):
+        self.browser = browser
+        # Browser context reused across page fetches so connections and
+        # TLS sessions to the site stay alive between pages
+        self._context = None
+        self._context_lock = asyncio.Lock()
+
+    async def _get_context(self):
+        """Get this scraper's shared browser context, creating it on first use."""
+        if self._context is None:
+            async with self._context_lock:
+                if self._context is None:
+                    self._context = await self.browser.new_context(
+                        locale='de-DE',
+                        user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                    )
+        return self._context
+
+    async def aclose(self):
+        """Close the shared browser context."""
+        if self._context is not None:
+            try:
+                await self._context.close()
+            except Exception as e:
+                logger.debug(f"Failed to close {self.SITE_NAME} browser context: {e}")
+            self._context = None
+
+    async def _parse_html(self, html: str) -> list[ScrapedProduct]:
+        """Parse products from HTML, offloading large pages to a thread."""
+        if len(html) > self.INLINE_PARSE_MAX_HTML:
+            return await asyncio.to_thread(self._parse_products_from_html, html)
+        return self._parse_products_from_html(html)
+
     @property
     @abstractmethod
     def SITE_NAME(self) -> str:
@@ -172,8 +218,12 @@ class BaseScraper(ABC):
         return round(price / (weight_grams / 1000), 2)
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def normalize_brand(brand: str) -> str:
-        """Normalize brand name for matching (handles apostrophe variants, case)."""
+        """Normalize brand name for matching (handles apostrophe variants, case).
+
+        Memoized: brand names repeat heavily across the products of a page.
+        """
         if not brand:
             return ""
         # Lowercase and normalize apostrophe variants
@@ -302,9 +352,6 @@ class BeautifulSoupScraper(BaseScraper):
     CATEGORY_PATH: str = ""  # Category path for filters
     CATEGORY_PATH_CHECK: str = ""  # Skip category-level URLs
 
-    def __init__(self, browser=None):
-        self.browser = browser
-
     async def _fetch_page_with_js(self, url: str) -> Optional[str]:
         """Fetch page with JavaScript rendering using Playwright."""
         try:
@@ -313,10 +360,7 @@ class BeautifulSoupScraper(BaseScraper):
 
             # Use existing browser if provided, otherwise context manager (legacy/fallback)
             if self.browser:
-                context = await self.browser.new_context(
-                    locale='de-DE',
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                )
+                context = await self._get_context()
                 page = await context.new_page()
                 try:
                     await page.goto(url, wait_until='networkidle', timeout=60000)
@@ -339,7 +383,6 @@ class BeautifulSoupScraper(BaseScraper):
                     return html
                 finally:
                     await page.close()
-                    await context.close()
             else:
                 # Legacy method: launch new browser (should be avoided)
                 async with async_playwright() as p:
@@ -617,7 +660,7 @@ class BeautifulSoupScraper(BaseScraper):
                 break
 
             try:
-                products = await asyncio.to_thread(self._parse_products_from_html, html)
+                products = await self._parse_html(html)
             except Exception as e:
                 logger.error(f"Error parsing HTML: {e}")
                 products = []
@@ -663,7 +706,7 @@ class BeautifulSoupScraper(BaseScraper):
             if not html:
                 continue
 
-            products = await asyncio.to_thread(self._parse_products_from_html, html)
+            products = await self._parse_html(html)
             
             chunk = []
             # All products from this search are actually reduced
@@ -730,7 +773,7 @@ class BeautifulSoupScraper(BaseScraper):
             if not html:
                 break
 
-            products = await asyncio.to_thread(self._parse_products_from_html, html)
+            products = await self._parse_html(html)
             if not products:
                 break
 
@@ -875,9 +918,6 @@ class FressnapfScraper(BaseScraper):
         # All other products from wet food category are valid
         return True
 
-    def __init__(self, browser=None):
-        self.browser = browser
-
     async def _fetch_page_with_js(self, url: str) -> Optional[str]:
         """Fetch page with JavaScript rendering using Playwright."""
         try:
@@ -885,10 +925,7 @@ class FressnapfScraper(BaseScraper):
             await asyncio.sleep(delay)
 
             if self.browser:
-                context = await self.browser.new_context(
-                    locale='de-DE',
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                )
+                context = await self._get_context()
                 page = await context.new_page()
                 try:
                     await page.goto(url, wait_until='networkidle', timeout=60000)
@@ -906,7 +943,6 @@ class FressnapfScraper(BaseScraper):
                     return html
                 finally:
                     await page.close()
-                    await context.close()
             else:
                 # Fallback
                 async with async_playwright() as p:
@@ -1111,7 +1147,7 @@ class FressnapfScraper(BaseScraper):
             if not html:
                 break
 
-            products = await asyncio.to_thread(self._parse_products_from_html, html)
+            products = await self._parse_html(html)
             if not products:
                 break
 
@@ -1154,7 +1190,7 @@ class FressnapfScraper(BaseScraper):
         if not html:
             return
 
-        products = await asyncio.to_thread(self._parse_products_from_html, html)
+        products = await self._parse_html(html)
         
         chunk = []
 
@@ -1419,9 +1455,6 @@ class ZooroyalScraper(BaseScraper):
             base_id = f"{base_id}:{query['sDetail'][0]}"
         return f"{self.SITE_NAME}:{base_id}"
 
-    def __init__(self, browser=None):
-        self.browser = browser
-
     async def _fetch_and_extract_products(self, url: str) -> list[dict]:
         """Fetch page and extract product data using JavaScript (for shadow DOM)."""
         try:
@@ -1429,10 +1462,7 @@ class ZooroyalScraper(BaseScraper):
             await asyncio.sleep(delay)
 
             if self.browser:
-                context = await self.browser.new_context(
-                    locale='de-DE',
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                )
+                context = await self._get_context()
                 page = await context.new_page()
                 try:
                     await page.goto(url, wait_until='networkidle', timeout=60000)
@@ -1451,7 +1481,6 @@ class ZooroyalScraper(BaseScraper):
                     return products
                 finally:
                     await page.close()
-                    await context.close()
             else:
                  # Fallback
                 async with async_playwright() as p:
@@ -1640,22 +1669,24 @@ class ZooroyalScraper(BaseScraper):
 
     def _get_brand_slugs(self, brands: list[str], include_default_brands: bool = True) -> list[str]:
         """Get Zooroyal brand URL slugs, always including quality brands."""
-        # Start with quality brand slugs
-        slugs = list(self.QUALITY_BRAND_SLUGS) if include_default_brands else []
+        # Start with quality brand slugs (dict keeps insertion order and removes duplicates)
+        slugs = dict.fromkeys(self.QUALITY_BRAND_SLUGS) if include_default_brands else {}
 
         # Add any additional watched brands from user
         for brand in (brands or []):
             brand_lower = self.normalize_brand(brand)
             # Direct match
-            if brand_lower in self.BRAND_SLUGS:
-                slugs.append(self.BRAND_SLUGS[brand_lower])
-            else:
-                # Try partial match
-                for known_brand, slug in self.BRAND_SLUGS.items():
-                    if brand_lower in known_brand or known_brand in brand_lower:
-                        slugs.append(slug)
-                        break
-        return list(set(slugs))  # Remove duplicates
+            slug = self.BRAND_SLUGS.get(brand_lower)
+            if slug:
+                slugs[slug] = None
+                continue
+
+            # Try partial match (first known brand in BRAND_SLUGS order wins)
+            for known_brand, slug in self.BRAND_SLUGS.items():
+                if brand_lower in known_brand or known_brand in brand_lower:
+                    slugs[slug] = None
+                    break
+        return list(slugs)
 
     async def _scrape_single_brand(self, slug: str, max_price_per_kg: float, max_pages: int, semaphore: asyncio.Semaphore) -> AsyncGenerator[list[ScrapedProduct], None]:
         """
@@ -1664,6 +1695,10 @@ class ZooroyalScraper(BaseScraper):
         """
         brand_url = f"{self.CATEGORY_URL}{slug}"
 
+        # Apply price filter using max of user's price and default (30% headroom)
+        scrape_price = max(max_price_per_kg or 0, self.DEFAULT_MAX_PRICE_PER_KG)
+        price_limit = scrape_price * 1.3
+
         async with semaphore:
             logger.info(f"Scraping Zooroyal brand: {slug}")
 
@@ -1682,10 +1717,8 @@ class ZooroyalScraper(BaseScraper):
                     if not product:
                         continue
 
-                    # Apply price filter using max of user's price and default
-                    scrape_price = max(max_price_per_kg or 0, self.DEFAULT_MAX_PRICE_PER_KG)
                     price_per_kg = product.reduced_price_per_kg or product.original_price_per_kg
-                    if price_per_kg and price_per_kg > scrape_price * 1.3:  # 30% headroom
+                    if price_per_kg and price_per_kg > price_limit:
                         continue
 
                     chunk.append(product)
@@ -1713,7 +1746,7 @@ class ZooroyalScraper(BaseScraper):
 
         semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_BRANDS)
         queue = asyncio.Queue()
-        
+
         # Producer function to drive a single brand scrape and push chunks to queue
         async def producer(slug):
             try:
@@ -1721,22 +1754,20 @@ class ZooroyalScraper(BaseScraper):
                     await queue.put(chunk)
             except Exception as e:
                 logger.error(f"Error scraping Zooroyal brand {slug}: {e}")
+
+        # Run all producers, then signal completion once with a single sentinel
+        async def run_producers():
+            try:
+                await asyncio.gather(*(producer(slug) for slug in brand_slugs))
             finally:
-                await queue.put(None) # Signal completion for this producer
+                await queue.put(None)
+
+        producers_task = asyncio.create_task(run_producers())
 
-        # Start producers
-        active_producers = 0
-        for slug in brand_slugs:
-            asyncio.create_task(producer(slug))
-            active_producers += 1
-            
         # Consume from queue
         seen_ids = set()
-        while active_producers > 0:
-            item = await queue.get()
-            if item is None:
-                active_producers -= 1
-            else:
+        try:
+            while (item := await queue.get()) is not None:
                 # Deduplicate yielded items against this session
                 chunk = []
                 for p in item:
@@ -1745,6 +1776,10 @@ class ZooroyalScraper(BaseScraper):
                         chunk.append(p)
                 if chunk:
                     yield chunk
+        finally:
+            # Stop producers if the consumer exits early
+            if not producers_task.done():
+                producers_task.cancel()
 
 
 class Zoo24Scraper(BaseScraper):
@@ -1762,10 +1797,22 @@ class Zoo24Scraper(BaseScraper):
     SEARCH_URL = "https://www.zoo24.de/search"
     MAX_SEARCH_PAGES = 35
 
-    MAX_SEARCH_PAGES = 35
-
-    def __init__(self, browser=None):
-        self.browser = browser
+    # Lazy-load settling: scroll on every poll, done once the product-card count
+    # has held for CARD_COUNT_STABLE_POLLS consecutive polls (or the timeout hits)
+    CARD_COUNT_POLL_MS = 500
+    CARD_COUNT_STABLE_POLLS = 3
+    CARD_COUNT_TIMEOUT_MS = 10000
+    CARD_COUNT_STABLE_JS = '''(stablePolls) => {
+        window.scrollTo(0, document.body.scrollHeight);
+        const n = document.querySelectorAll('product-card').length;
+        if (window.__lastCardCount === n) {
+            window.__stableCardPolls = (window.__stableCardPolls || 0) + 1;
+        } else {
+            window.__lastCardCount = n;
+            window.__stableCardPolls = 0;
+        }
+        return window.__stableCardPolls >= stablePolls;
+    }'''
 
     def _is_wet_food(self, name: str) -> bool:
         """Check if product is wet cat food (exclude dry food, snacks, accessories)."""
@@ -1794,10 +1841,7 @@ class Zoo24Scraper(BaseScraper):
             await asyncio.sleep(delay)
 
             if self.browser:
-                context = await self.browser.new_context(
-                    locale='de-DE',
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                )
+                context = await self._get_context()
                 page = await context.new_page()
                 try:
                     await page.goto(url, wait_until='domcontentloaded', timeout=30000)
@@ -1809,16 +1853,21 @@ class Zoo24Scraper(BaseScraper):
                         logger.warning(f"No product-card elements found on {url}")
                         return None
 
-                    # Scroll to load lazy content
-                    for _ in range(3):
-                        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        await asyncio.sleep(1)
+                    # Keep scrolling while lazy-loaded cards keep appearing
+                    try:
+                        await page.wait_for_function(
+                            self.CARD_COUNT_STABLE_JS,
+                            arg=self.CARD_COUNT_STABLE_POLLS,
+                            polling=self.CARD_COUNT_POLL_MS,
+                            timeout=self.CARD_COUNT_TIMEOUT_MS
+                        )
+                    except Exception as e:
+                        logger.debug(f"Zoo24: Card count did not settle on {url}: {e}")
 
                     html = await page.content()
                     return html
                 finally:
                     await page.close()
-                    await context.close()
             else:
                  # Fallback
                 async with async_playwright() as p:
@@ -1837,7 +1886,7 @@ class Zoo24Scraper(BaseScraper):
     def _parse_products_from_html(self, html: str) -> list[ScrapedProduct]:
         """Parse products from rendered Zoo24 HTML."""
         products = []
-        soup = BeautifulSoup(html, 'lxml')
+        soup = BeautifulSoup(html, 'lxml', parse_only=ZOO24_CARD_STRAINER)
 
         cards = soup.find_all('product-card')
         logger.info(f"Zoo24: Found {len(cards)} product cards")
@@ -1870,7 +1919,7 @@ class Zoo24Scraper(BaseScraper):
         url = urljoin(self.BASE_URL, href)
 
         # Get title
-        title_elem = card.select_one('.product-card__title')
+        title_elem = card.find(class_='product-card__title')
         name = title_elem.get_text(strip=True) if title_elem else None
         if not name:
             return None
@@ -1970,9 +2019,10 @@ class Zoo24Scraper(BaseScraper):
     async def scrape_brand_products(self, brands: list[str], max_price_per_kg: float = None, max_pages: int = None, include_default_brands: bool = True) -> AsyncGenerator[list[ScrapedProduct], None]:
         """Scrape wet cat food from Zoo24 search, filtered by brands and price."""
         all_brands = list(set((self.QUALITY_BRANDS if include_default_brands else []) + (brands or [])))
-        brand_set = {self.normalize_brand(b) for b in all_brands}
+        brand_set = frozenset(self.normalize_brand(b) for b in all_brands)
 
         scrape_price = max(max_price_per_kg or 0, self.DEFAULT_MAX_PRICE_PER_KG)
+        price_limit = scrape_price * 1.3  # 30% headroom
         pages_limit = max_pages or self.MAX_SEARCH_PAGES
 
         seen_ids = set()
@@ -1986,26 +2036,17 @@ class Zoo24Scraper(BaseScraper):
             if not html:
                 break
 
-            products = await asyncio.to_thread(self._parse_products_from_html, html)
+            products = await self._parse_html(html)
             if not products:
                 break
 
             chunk = []
             page_has_valid = False
             for p in products:
-                # Filter by brand
-                if p.brand and self.normalize_brand(p.brand) not in brand_set:
-                    continue
-
-                # If no brand detected, skip (search returns many unrelated items)
-                if not p.brand:
-                    continue
-
+                # Cheap numeric check first: results are sorted by price ascending,
+                # so stop once the price per kg consistently exceeds the threshold
                 price_per_kg = p.reduced_price_per_kg or p.original_price_per_kg
-
-                # Early termination: results are sorted by price ascending
-                # If price per kg exceeds threshold with headroom, stop
-                if price_per_kg and price_per_kg > scrape_price * 1.3:
+                if price_per_kg and price_per_kg > price_limit:
                     exceeded_price_count += 1
                     if exceeded_price_count >= 10:
                         logger.info(f"Zoo24: Price threshold exceeded consistently, stopping at page {page_num}")
@@ -2015,6 +2056,11 @@ class Zoo24Scraper(BaseScraper):
                 else:
                     exceeded_price_count = 0
 
+                # Filter by brand; if no brand detected, skip (search returns many unrelated items)
+                normalized_brand = p.normalized_brand
+                if not normalized_brand or normalized_brand not in brand_set:
+                    continue
+
                 if p.external_id not in seen_ids:
                     seen_ids.add(p.external_id)
                     chunk.append(p)
@@ -2030,7 +2076,7 @@ class Zoo24Scraper(BaseScraper):
     async def scrape_reduced_products(self, brands: list[str] = None) -> AsyncGenerator[list[ScrapedProduct], None]:
         """Scrape reduced/sale products from Zoo24 search."""
         all_brands = list(set(self.QUALITY_BRANDS + (brands or [])))
-        brand_set = {self.normalize_brand(b) for b in all_brands}
+        brand_set = frozenset(self.normalize_brand(b) for b in all_brands)
 
         seen_ids = set()
 
@@ -2043,7 +2089,7 @@ class Zoo24Scraper(BaseScraper):
             if not html:
                 break
 
-            products = await asyncio.to_thread(self._parse_products_from_html, html)
+            products = await self._parse_html(html)
             if not products:
                 break
 
@@ -2053,9 +2099,8 @@ class Zoo24Scraper(BaseScraper):
                     continue
 
                 # Filter by brand
-                if p.brand and self.normalize_brand(p.brand) not in brand_set:
-                    continue
-                if not p.brand:
+                normalized_brand = p.normalized_brand
+                if not normalized_brand or normalized_brand not in brand_set:
                     continue
 
                 if p.external_id not in seen_ids:
@@ -2088,32 +2133,64 @@ async def _scrape_site(scraper, watched_brands: list[str], max_price_per_kg: flo
         logger.error(f"Error scraping {site_name}: {e}")
 
 
+# Browser shared across scrape_all_async runs (launched on first use)
+_playwright = None
+_browser = None
+_browser_lock = asyncio.Lock()
+
+
+async def _get_browser():
+    """Get the shared browser, launching it on first use or after it disconnected."""
+    global _playwright, _browser
+    async with _browser_lock:
+        if _browser is None or not _browser.is_connected():
+            if _playwright is None:
+                _playwright = await async_playwright().start()
+            logger.info("Launching shared browser instance...")
+            _browser = await _playwright.chromium.launch(headless=True)
+    return _browser
+
+
+async def shutdown_browser():
+    """Close the shared browser and Playwright driver (call on process exit)."""
+    global _playwright, _browser
+    async with _browser_lock:
+        try:
+            if _browser is not None:
+                await _browser.close()
+            if _playwright is not None:
+                await _playwright.stop()
+        except Exception as e:
+            logger.error(f"Failed to shut down browser: {e}")
+        _browser = None
+        _playwright = None
+
+
 async def scrape_all_async(watched_brands: list[str] = None, max_price_per_kg: float = None, include_default_brands: bool = True, on_chunk_callback: Callable[[list[ScrapedProduct]], None] = None) -> None:
     """Main async function to scrape products from all sites in parallel.
     Products are reported via on_chunk_callback as they are found.
     """
     try:
-        # Launch browser once for all scrapers
-        async with async_playwright() as p:
-            logger.info("Launching shared browser instance...")
-            browser = await p.chromium.launch(headless=True)
-            
-            # Use the shared browser instance for all scrapers
-            scrapers = [
-                ZooplusScraper(browser=browser), 
-                BitibaScraper(browser=browser), 
-                ZooroyalScraper(browser=browser), 
-                FressnapfScraper(browser=browser), 
-                Zoo24Scraper(browser=browser)
-            ]
+        # Reuse one browser for all scrapers and across runs
+        browser = await _get_browser()
+
+        # Each run gets its own scrapers (and browser contexts)
+        scrapers = [
+            ZooplusScraper(browser=browser), 
+            BitibaScraper(browser=browser), 
+            ZooroyalScraper(browser=browser), 
+            FressnapfScraper(browser=browser), 
+            Zoo24Scraper(browser=browser)
+        ]
 
+        try:
             # Run all scrapers concurrently
             await asyncio.gather(
                 *[_scrape_site(scraper, watched_brands, max_price_per_kg, include_default_brands, on_chunk_callback) for scraper in scrapers],
                 return_exceptions=True
             )
-
-            await browser.close()
+        finally:
+            await asyncio.gather(*[scraper.aclose() for scraper in scrapers])
             
     except Exception as e:
         logger.error(f"Fatal error during scraping: {e}")
@@ -2125,8 +2202,14 @@ def scrape_all() -> list[ScrapedProduct]:
     results = []
     async def collector(chunk):
         results.extend(chunk)
-    
-    asyncio.run(scrape_all_async(on_chunk_callback=collector))
+
+    async def _run():
+        try:
+            await scrape_all_async(on_chunk_callback=collector)
+        finally:
+            await shutdown_browser()
+
+    asyncio.run(_run())
     return results
 
 
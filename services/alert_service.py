@@ -1,9 +1,14 @@
 import logging
 import asyncio
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload
 from telegram import Bot
+from telegram.request import HTTPXRequest
 
 from config import settings
-from database import get_session, Product, PriceHistory, AlertSent, UserPreferences
+from database import SessionLocal, Product, PriceHistory, AlertSent, UserPreferences
 from scraper import ZooplusScraper
 from bot.formatter import format_alert_message, format_cheapest_variant_alert
 from services.deal_service import find_cheapest_variants
@@ -11,13 +16,63 @@ from services.deal_service import find_cheapest_variants
 
 logger = logging.getLogger(__name__)
 
+# Max number of Telegram messages in flight at once
+MAX_CONCURRENT_SENDS = 10
+
+# Sent alerts are recorded in batches of this size, or after this many idle seconds
+ALERT_RECORD_BATCH_SIZE = 50
+ALERT_RECORD_INTERVAL = 1.0
+
+# Shared across concurrent send_alerts_grouped calls (one per scraped chunk), so the
+# global send bound and per-chat ordering hold for the whole check
+_send_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+_chat_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# (match_key, price, chat_id) of alerts being sent and not yet recorded in AlertSent.
+# Concurrent calls skip these, since their AlertSent snapshot can't see them yet.
+_reserved_alerts: set[tuple[str, float, str]] = set()
+
+# Shared Bot instance so all alerts reuse one HTTP connection pool
+_bot: Optional[Bot] = None
+_bot_lock = asyncio.Lock()
+
+
+async def _get_bot() -> Bot:
+    """Get the shared Bot instance, creating it on first use."""
+    global _bot
+    if _bot is not None:
+        return _bot
+
+    async with _bot_lock:
+        if _bot is None:
+            # Size the keep-alive pool for concurrent sends (the default pool holds one connection)
+            bot = Bot(
+                token=settings.telegram_bot_token,
+                request=HTTPXRequest(connection_pool_size=MAX_CONCURRENT_SENDS)
+            )
+            await bot.initialize()
+            _bot = bot
+    return _bot
+
+
+async def shutdown_bot():
+    """Close the shared Bot instance (call on process exit)."""
+    global _bot
+    async with _bot_lock:
+        if _bot is not None:
+            try:
+                await _bot.shutdown()
+            except Exception as e:
+                logger.error(f"Failed to shut down alert bot: {e}")
+            _bot = None
+
 async def send_message_to_user(chat_id: str, message: str) -> bool:
     """Send a formatted message to a user via Telegram."""
     if not settings.telegram_bot_token:
         return False
 
     try:
-        bot = Bot(token=settings.telegram_bot_token)
+        bot = await _get_bot()
         await bot.send_message(
             chat_id=chat_id,
             text=message,
@@ -36,7 +91,7 @@ async def send_alert_to_user(product: Product, price: PriceHistory, chat_id: str
         return False
 
     try:
-        bot = Bot(token=settings.telegram_bot_token)
+        bot = await _get_bot()
         message = format_alert_message(product, price, max_price_per_kg)
 
         await bot.send_message(
@@ -53,6 +108,50 @@ async def send_alert_to_user(product: Product, price: PriceHistory, chat_id: str
         logger.error(f"Failed to send alert to {chat_id}: {e}")
         return False
 
+def _record_alerts_sync(rows: list[dict]) -> None:
+    """Insert a batch of AlertSent rows in one statement and commit."""
+    with SessionLocal() as session:
+        try:
+            session.execute(insert(AlertSent), rows)
+            session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record {len(rows)} sent alerts: {e}")
+            session.rollback()
+
+
+async def _record_sent_alerts(queue: asyncio.Queue) -> None:
+    """
+    Record sent alerts from the queue until a None sentinel arrives.
+    Writes a batch when it reaches ALERT_RECORD_BATCH_SIZE or after
+    ALERT_RECORD_INTERVAL seconds without a new alert.
+    """
+    batch = []
+    while True:
+        try:
+            row = await asyncio.wait_for(queue.get(), ALERT_RECORD_INTERVAL)
+            timed_out = False
+        except asyncio.TimeoutError:
+            row = None
+            timed_out = True
+
+        if row is not None:
+            batch.append(row)
+            if len(batch) < ALERT_RECORD_BATCH_SIZE:
+                continue
+
+        if batch:
+            # DB write runs in a thread so sends keep going meanwhile
+            await asyncio.to_thread(_record_alerts_sync, batch)
+            # Recorded alerts are now visible to the sent-alerts query of later calls
+            _reserved_alerts.difference_update(
+                (row["match_key"], row["price_at_alert"], row["chat_id"]) for row in batch
+            )
+            batch = []
+
+        if row is None and not timed_out:
+            return
+
+
 async def send_alerts_grouped(product_price_ids: list[tuple[int, int]]) -> int:
     """
     Send alerts for products, only alerting for the cheapest variant per product.
@@ -64,70 +163,120 @@ async def send_alerts_grouped(product_price_ids: list[tuple[int, int]]) -> int:
     if not settings.telegram_bot_token or not product_price_ids:
         return 0
 
-    session = get_session()
     alerts_sent = 0
 
-    try:
-        # Load all products and prices
+    with SessionLocal() as session:
+        # Load all products and prices (one IN query each)
+        pids = {pid for pid, _ in product_price_ids}
+        rids = {rid for _, rid in product_price_ids}
+        products = {p.id: p for p in session.query(Product).filter(Product.id.in_(pids)).all()}
+        prices = {r.id: r for r in session.query(PriceHistory).filter(PriceHistory.id.in_(rids)).all()}
+
         products_data = []
         for product_id, price_id in product_price_ids:
-            product = session.query(Product).get(product_id)
-            price = session.query(PriceHistory).get(price_id)
+            product = products.get(product_id)
+            price = prices.get(price_id)
             if product and price:
                 ppkg = price.reduced_price_per_kg or price.original_price_per_kg
                 products_data.append((product, price, ppkg))
 
-        # Get all configured users
-        all_users = session.query(UserPreferences).filter(
+        # Get all configured users (with their brand lists loaded up front)
+        all_users = session.query(UserPreferences).options(joinedload(UserPreferences.brands)).filter(
             UserPreferences.max_price_per_kg.isnot(None)
         ).all()
+        if not all_users:
+            return 0
 
-        for prefs in all_users:
-            # Filter products for this user (brand + price threshold)
-            user_products = []
-            for product, price, ppkg in products_data:
-                if not prefs.should_notify_for_brand(product.brand):
-                    continue
-                if ppkg is None or ppkg > prefs.max_price_per_kg:
-                    continue
-                user_products.append((product, price, ppkg))
+        # Preload already-sent alerts for these offers in one query
+        # Keyed by (match_key, price, chat_id) for cross-site duplicate detection
+        match_keys = {product.match_key for product, _, _ in products_data}
+        alert_prices = {price.current_price for _, price, _ in products_data}
+        chat_ids = {prefs.chat_id for prefs in all_users}
+        sent_set: set[tuple[str, float, str]] = {
+            tuple(row) for row in session.query(
+                AlertSent.match_key, AlertSent.price_at_alert, AlertSent.chat_id
+            ).filter(
+                AlertSent.match_key.in_(match_keys),
+                AlertSent.price_at_alert.in_(alert_prices),
+                AlertSent.chat_id.in_(chat_ids)
+            ).all()
+        }
 
-            if not user_products:
-                continue
+        # Alerts to send: (chat_id, product, price, message)
+        pending = []
+        # Keys this call claimed in _reserved_alerts, and those it actually sent
+        reserved_keys: list[tuple[str, float, str]] = []
+        sent_keys: set[tuple[str, float, str]] = set()
+
+        try:
+            for prefs in all_users:
+                # Filter products for this user (brand + price threshold)
+                user_products = []
+                for product, price, ppkg in products_data:
+                    if not prefs.should_notify_for_brand(product.brand):
+                        continue
+                    if ppkg is None or ppkg > prefs.max_price_per_kg:
+                        continue
+                    user_products.append((product, price, ppkg))
 
-            # Find cheapest variants
-            cheapest_deals = find_cheapest_variants(user_products)
-
-            for cheapest_product, cheapest_price, _, other_sites in cheapest_deals:
-                # Check if already alerted for this match_key (cross-site duplicate detection)
-                existing = session.query(AlertSent).filter(
-                    AlertSent.match_key == cheapest_product.match_key,
-                    AlertSent.price_at_alert == cheapest_price.current_price,
-                    AlertSent.chat_id == prefs.chat_id
-                ).first()
-                if existing:
+                if not user_products:
                     continue
 
-                # Send alert for cheapest variant only
-                message = format_cheapest_variant_alert(
-                    cheapest_product, cheapest_price, prefs.max_price_per_kg, other_sites
-                )
-                success = await send_message_to_user(prefs.chat_id, message)
+                # Find cheapest variants
+                cheapest_deals = find_cheapest_variants(user_products)
+
+                for cheapest_product, cheapest_price, _, other_sites in cheapest_deals:
+                    # Check if already alerted for this match_key (cross-site duplicate detection),
+                    # or being alerted by a concurrent call; otherwise claim it
+                    alert_key = (cheapest_product.match_key, cheapest_price.current_price, prefs.chat_id)
+                    if alert_key in sent_set or alert_key in _reserved_alerts:
+                        continue
+                    _reserved_alerts.add(alert_key)
+                    reserved_keys.append(alert_key)
+
+                    # Send alert for cheapest variant only
+                    message = format_cheapest_variant_alert(
+                        cheapest_product, cheapest_price, prefs.max_price_per_kg, other_sites
+                    )
+                    pending.append((prefs.chat_id, cheapest_product, cheapest_price, message))
+
+            if not pending:
+                return 0
 
+            # Send alerts concurrently across chats, bounded to stay within Telegram's
+            # global rate limit; messages to the same chat go out one at a time.
+            # Successful sends are recorded by a consumer task while sending continues.
+            sent_queue: asyncio.Queue[Optional[dict]] = asyncio.Queue()
+
+            async def _send(chat_id: str, product: Product, price: PriceHistory, message: str) -> bool:
+                async with _chat_locks[chat_id], _send_semaphore:
+                    success = await send_message_to_user(chat_id, message)
                 if success:
-                    alert = AlertSent(
-                        product_id=cheapest_product.id,
-                        match_key=cheapest_product.match_key,
-                        price_at_alert=cheapest_price.current_price,
-                        chat_id=prefs.chat_id
+                    logger.info(f"Alert sent to {chat_id} for {product.base_product_id}")
+                    sent_keys.add((product.match_key, price.current_price, chat_id))
+                    await sent_queue.put({
+                        "product_id": product.id,
+                        "match_key": product.match_key,
+                        "price_at_alert": price.current_price,
+                        "chat_id": chat_id
+                    })
+                return success
+
+            async def _produce() -> list:
+                try:
+                    return await asyncio.gather(
+                        *[_send(chat_id, product, price, message) for chat_id, product, price, message in pending],
+                        return_exceptions=True
                     )
-                    session.add(alert)
-                    session.commit()
-                    alerts_sent += 1
-                    logger.info(f"Alert sent to {prefs.chat_id} for {cheapest_product.base_product_id}")
+                finally:
+                    await sent_queue.put(None)
 
-    finally:
-        session.close()
+            results, _ = await asyncio.gather(_produce(), _record_sent_alerts(sent_queue))
+            alerts_sent = sum(1 for success in results if success is True)
+        finally:
+            # Keys that were not sent are released so a later call may alert them;
+            # sent ones are released by _record_sent_alerts once recorded
+            _reserved_alerts.difference_update(key for key in reserved_keys if key not in sent_keys)
 
     return alerts_sent
 
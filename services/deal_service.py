@@ -1,142 +1,177 @@
+import heapq
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+from typing import NamedTuple, Optional, List, Tuple
 
-from sqlalchemy import func, or_, and_
+from sqlalchemy import func, or_, select
 
-from database import get_session, Product, PriceHistory, UserPreferences
+from database import SessionLocal, compute_discount_percent, generate_match_key, Product, PriceHistory, UserPreferences
 from scraper import ZooplusScraper
 
 logger = logging.getLogger(__name__)
 
+
+class DealProduct(NamedTuple):
+    """Read-only view of the Product columns needed to present a deal."""
+    id: int
+    name: str
+    brand: Optional[str]
+    size: Optional[str]
+    site: str
+    url: str
+    base_product_id: Optional[str]
+
+    @property
+    def match_key(self) -> str:
+        """Get the cross-site match key for this product."""
+        return generate_match_key(self.brand, self.size, self.name)
+
+
+class DealPrice(NamedTuple):
+    """Read-only view of the PriceHistory columns needed to present a deal."""
+    id: int
+    current_price: float
+    original_price: Optional[float]
+    reduced_price_per_kg: Optional[float]
+    original_price_per_kg: Optional[float]
+
+    @property
+    def discount_percent(self) -> float:
+        return compute_discount_percent(self.original_price, self.current_price)
+
+
 def get_deals_from_db(prefs: UserPreferences, session, brands_filter: list[str] = None, limit: int = 1000) -> list[tuple]:
     """
     Query existing deals from database matching user preferences.
-    Returns list of (product, price, price_per_kg) tuples sorted by price_per_kg.
+    Returns list of (DealProduct, DealPrice, price_per_kg) tuples sorted by price_per_kg.
+    Only the columns needed for presentation are loaded (no ORM objects).
     """
     if prefs.max_price_per_kg is None:
         return []
 
-    # Subquery to get the latest PriceHistory record for each product
-    latest_price_subq = session.query(
-        PriceHistory.product_id,
-        func.max(PriceHistory.recorded_at).label('max_recorded')
-    ).group_by(PriceHistory.product_id).subquery()
+    # Without an explicit filter only watched brands qualify; nothing to query if there are none
+    if not brands_filter and not prefs.get_brands_list():
+        return []
+
+    # Rank each product's recent prices newest-first; rn == 1 is the latest record.
+    # Served by the (product_id, recorded_at, ...) index instead of aggregate + self-join.
+    ranked_prices = select(
+        PriceHistory.id.label('price_id'),
+        func.row_number().over(
+            partition_by=PriceHistory.product_id,
+            # recorded_at is shared by a whole batch (second resolution on SQLite); id breaks ties
+            order_by=(PriceHistory.recorded_at.desc(), PriceHistory.id.desc())
+        ).label('rn')
+    ).where(
+        PriceHistory.recorded_at >= datetime.utcnow() - timedelta(hours=48)
+    ).subquery()
 
     # Query products with their latest price, filtered by price threshold
-    deals = session.query(Product, PriceHistory).join(
+    query = select(
+        Product.id, Product.name, Product.brand, Product.size, Product.site, Product.url,
+        Product.base_product_id,
+        PriceHistory.id, PriceHistory.current_price, PriceHistory.original_price,
+        PriceHistory.reduced_price_per_kg, PriceHistory.original_price_per_kg
+    ).join(
         PriceHistory, Product.id == PriceHistory.product_id
     ).join(
-        latest_price_subq,
-        (PriceHistory.product_id == latest_price_subq.c.product_id) &
-        (PriceHistory.recorded_at == latest_price_subq.c.max_recorded)
-    ).filter(
-        (PriceHistory.recorded_at >= datetime.utcnow() - timedelta(hours=48)) &
-        ((PriceHistory.reduced_price_per_kg <= prefs.max_price_per_kg) |
-         (PriceHistory.reduced_price_per_kg.is_(None) &
-          (PriceHistory.original_price_per_kg <= prefs.max_price_per_kg)))
-    ).all()
-
-    # Filter by brand and build result list
+        ranked_prices,
+        (PriceHistory.id == ranked_prices.c.price_id) & (ranked_prices.c.rn == 1)
+    ).where(
+        PriceHistory.effective_price_per_kg <= prefs.max_price_per_kg
+    )
+
+    # Apply explicit brand filter in SQL (products without a brand are kept)
+    if brands_filter:
+        query = query.where(or_(
+            Product.brand.is_(None),
+            Product.brand == "",
+            Product.brand.in_(brands_filter)
+        ))
+        # No Python-side filtering follows, so the DB can return just the top rows
+        query = query.order_by(PriceHistory.effective_price_per_kg).limit(limit)
+    else:
+        # should_notify_for_brand rejects products without a brand; drop them in SQL
+        query = query.where(Product.brand.isnot(None), Product.brand != "")
+
+    deals = session.execute(query).all()
+
+    # Filter by watched brands and build result list
     filtered_deals = []
 
-    for product, price in deals:
-        # Apply brand filter
-        if brands_filter:
-            if product.brand and product.brand not in brands_filter:
-                continue
-        else:
-            if not prefs.should_notify_for_brand(product.brand):
-                continue
+    product_fields = len(DealProduct._fields)
+    for row in deals:
+        product = DealProduct(*row[:product_fields])
+        if not brands_filter and not prefs.should_notify_for_brand(product.brand):
+            continue
+        price = DealPrice(*row[product_fields:])
 
         ppkg = price.reduced_price_per_kg or price.original_price_per_kg
         filtered_deals.append((product, price, ppkg))
 
-    # Sort by price per kg
-    filtered_deals.sort(key=lambda x: x[2] if x[2] else 999)
-    
     logger.info(f"get_deals_from_db: Found {len(filtered_deals)} matching deals (limit: {limit})")
-    
-    return filtered_deals[:limit]
+
+    # Sort by price per kg; only the top `limit` need ordering when there are more
+    sort_key = lambda x: x[2] if x[2] else 999
+    if limit < len(filtered_deals):
+        return heapq.nsmallest(limit, filtered_deals, key=sort_key)
+    filtered_deals.sort(key=sort_key)
+    return filtered_deals
 
 def has_data_for_price_range(max_price: float) -> bool:
     """
     Check if we have any product data in the DB for the given price range.
     """
-    session = get_session()
-    try:
-        count = session.query(PriceHistory).filter(
-            or_(
-                PriceHistory.reduced_price_per_kg <= max_price,
-                and_(
-                    PriceHistory.reduced_price_per_kg.is_(None),
-                    PriceHistory.original_price_per_kg <= max_price
-                )
-            )
-        ).limit(1).count()
-        return count > 0
-    finally:
-        session.close()
+    with SessionLocal() as session:
+        matching = select(PriceHistory.id).where(
+            PriceHistory.effective_price_per_kg <= max_price
+        )
+        # SELECT EXISTS(...) stops at the first matching row
+        return session.execute(select(matching.exists())).scalar()
 
 def get_data_freshness() -> Optional[datetime]:
     """Get the timestamp of the most recent price record."""
-    session = get_session()
-    try:
-        result = session.query(func.max(PriceHistory.recorded_at)).scalar()
+    with SessionLocal() as session:
+        result = session.execute(select(func.max(PriceHistory.recorded_at))).scalar()
         return result
-    finally:
-        session.close()
 
 def find_cheapest_variants(deals: List[Tuple[Product, PriceHistory, float]]) -> List[Tuple[Product, PriceHistory, float, List[Tuple[str, float, str]]]]:
     """
     Group deals by match_key and return the cheapest variant per group.
     Returns: List of (product, price, price_per_kg, other_sites_info)
     """
-    from collections import defaultdict
-    product_groups = defaultdict(list)
-    
-    for product, price, ppkg in deals:
-        key = product.match_key
-        product_groups[key].append((product, price, ppkg))
+    # Single pass: match_key (brand|size) -> site -> cheapest (product, price, ppkg)
+    # Dedupes per site and groups sites of the same product at the same time
+    grouped_variants: dict[str, dict[str, tuple]] = {}
+    unique_count = 0
+    for deal in deals:
+        product, _, ppkg = deal
+        by_site = grouped_variants.setdefault(product.match_key, {})
+        current = by_site.get(product.site)
+        if current is None:
+            by_site[product.site] = deal
+            unique_count += 1
+        elif ppkg < current[2]:
+            # Keep cheaper one
+            by_site[product.site] = deal
 
+    logger.info(f"find_cheapest_variants: Reduced {len(deals)} deals to {unique_count} unique offerings")
+
+    # For each group, pick the absolute cheapest as main, others as "other sites"
     cheapest_deals = []
-    
-    # Simple deduplication: prefer cheapest per (brand, size, site) tuple
-    # Then group by (brand, size) to show "other sites"
-    
-    # 1. Deduplicate by (brand, size, site) -> keep cheapest
-    unique_deals = {}
-    for product, price, ppkg in deals:
-        # Key: brand | size | site
-        # Use match_key which is brand|size, then add site
-        unique_key = f"{product.match_key}|{product.site}"
-        
-        if unique_key not in unique_deals:
-            unique_deals[unique_key] = (product, price, ppkg)
-        else:
-            # Keep cheaper one
-            if ppkg < unique_deals[unique_key][2]:
-                unique_deals[unique_key] = (product, price, ppkg)
-    
-    logger.info(f"find_cheapest_variants: Reduced {len(deals)} deals to {len(unique_deals)} unique offerings")
-    
-    # 2. Group by (brand, size) to link same products from other sites
-    grouped_variants = defaultdict(list)
-    for product, price, ppkg in unique_deals.values():
-        grouped_variants[product.match_key].append((product, price, ppkg))
-        
-    # 3. For each group, pick the absolute cheapest as main, others as "other sites"
-    for key, variants in grouped_variants.items():
-        # Sort variants by price ascending
-        variants.sort(key=lambda x: x[2])
-        
-        cheapest = variants[0]
-        other_sites = []
-        
-        # Add other sites info
-        for p, pr, ppkg in variants[1:]:
-            other_sites.append((p.site.capitalize(), ppkg, p.url))
-            
+    for by_site in grouped_variants.values():
+        if len(by_site) == 1:
+            # Only one site offers this product (always the case for single-site input)
+            (product, price, ppkg), = by_site.values()
+            cheapest_deals.append((product, price, ppkg, []))
+            continue
+
+        cheapest = min(by_site.values(), key=lambda x: x[2])
+        other_sites = [
+            (variant[0].site.capitalize(), variant[2], variant[0].url)
+            for variant in sorted(by_site.values(), key=lambda x: x[2])
+            if variant is not cheapest
+        ]
         cheapest_deals.append((cheapest[0], cheapest[1], cheapest[2], other_sites))
 
     # Sort final list by price per kg
@@ -3,22 +3,31 @@ import logging
 from datetime import datetime, timedelta
 from typing import Optional
 
-from sqlalchemy import func
+from sqlalchemy import delete, func, insert, literal_column, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from config import settings
-from database import get_session, Product, PriceHistory, init_db
-from scraper import scrape_all_async, ScrapedProduct, ZooplusScraper
-from database import get_or_create_preferences
+from database import engine, async_engine, utcnow, compute_discount_percent, SessionLocal, AsyncSessionLocal, Product, PriceHistory, init_db
+from scraper import scrape_all_async, shutdown_browser, ScrapedProduct, ZooplusScraper
+from services.alert_service import send_alerts_grouped, shutdown_bot
 
 logger = logging.getLogger(__name__)
 
-# Global state to track if a check is currently running
-_is_running = False
+# Max products saved per DB transaction
+SAVE_BATCH_SIZE = 100
+
+# Scraped chunks waiting to be saved, and tasks saving them during a check
+CHUNK_QUEUE_SIZE = 2
+CHUNK_CONSUMERS = 2
+
+# Held while a check is running; a check started meanwhile is skipped
+_run_lock = asyncio.Lock()
 _last_run_start = None
 
 def is_check_running() -> bool:
     """Check if a price check is currently in progress."""
-    return _is_running
+    return _run_lock.locked()
 
 def get_last_run_start() -> Optional[datetime]:
     """Get the start time of the last run."""
@@ -26,170 +35,197 @@ def get_last_run_start() -> Optional[datetime]:
 
 
 
-def save_product(scraped: ScrapedProduct, session=None) -> tuple[int, bool]:
-    """Save or update a product in the database. Returns (product_id, is_new)."""
-    close_session = False
-    if not session:
-        session = get_session()
-        close_session = True
-        
-    try:
-        # Check if product exists
-        product = session.query(Product).filter(
-            Product.external_id == scraped.external_id,
-            Product.site == scraped.site
-        ).first()
-
-        is_new = False
-        if not product:
-            # Create new product
-            product = Product(
-                external_id=scraped.external_id,
-                base_product_id=scraped.base_product_id,
-                variant_name=scraped.variant_name,
-                name=scraped.name,
-                brand=scraped.brand,
-                size=scraped.size,
-                url=scraped.url,
-                site=scraped.site,
-                is_wet_food=True
-            )
-            session.add(product)
-            # Flush to get ID if we are in a transaction
-            session.flush()
-            if close_session:
-                session.commit()
-            
-            is_new = True
-            logger.info(f"New product: {product.name} (variant: {scraped.variant_name})")
-        else:
-            # Update existing product
-            product.name = scraped.name
-            product.brand = scraped.brand or product.brand
-            product.size = scraped.size or product.size
-            product.url = scraped.url
-            product.base_product_id = scraped.base_product_id or product.base_product_id
-            product.variant_name = scraped.variant_name or product.variant_name
-            product.updated_at = datetime.utcnow()
-            if close_session:
-                session.commit()
-
-        return product.id, is_new
-
-    finally:
-        if close_session:
-            session.close()
+def _insert(model):
+    """Dialect-specific INSERT for the configured database (supports ON CONFLICT)."""
+    if engine.dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
 
 
-def save_price(product_id: int, scraped: ScrapedProduct, session=None) -> int:
-    """Record a price point for a product. Returns price_id."""
-    close_session = False
-    if not session:
-        session = get_session()
-        close_session = True
-        
-    try:
-        price = PriceHistory(
-            product_id=product_id,
-            current_price=scraped.current_price,
-            original_price=scraped.original_price,
-            is_on_sale=scraped.is_on_sale,
-            sale_tag=scraped.sale_tag,
-            original_price_per_kg=scraped.original_price_per_kg,
-            reduced_price_per_kg=scraped.reduced_price_per_kg
-        )
-        session.add(price)
-        session.flush() # Ensure ID is generated
-        if close_session:
-            session.commit()
-            session.refresh(price)
-        return price.id
-
-    finally:
-        if close_session:
-            session.close()
+def save_products_bulk(scraped_list: list[ScrapedProduct], session) -> dict[str, tuple[int, bool]]:
+    """
+    Insert or update many products with a single INSERT ... ON CONFLICT statement.
+    Timestamps are computed by the database. Does not commit.
+    Returns {external_id: (product_id, is_new)}.
+    """
+    # One row per external_id (last occurrence wins, as with sequential updates)
+    by_external_id = {scraped.external_id: scraped for scraped in scraped_list}
+    if not by_external_id:
+        return {}
+
+    # Postgres reports inserted rows directly (xmax = 0); elsewhere the ids of existing
+    # rows are loaded beforehand to tell new products apart, no ORM objects are created
+    is_postgres = engine.dialect.name == "postgresql"
+    existing_ids = {}
+    if not is_postgres:
+        existing_ids = {
+            external_id: product_id
+            for product_id, external_id in session.execute(
+                select(Product.id, Product.external_id).where(Product.external_id.in_(by_external_id.keys()))
+            )
+        }
 
+    stmt = _insert(Product).values([
+        {
+            "external_id": scraped.external_id,
+            "base_product_id": scraped.base_product_id,
+            "variant_name": scraped.variant_name,
+            "name": scraped.name,
+            "brand": scraped.brand,
+            "size": scraped.size,
+            "url": scraped.url,
+            "site": scraped.site,
+            "is_wet_food": True,
+            "created_at": utcnow(),
+            "updated_at": utcnow(),
+        }
+        for scraped in by_external_id.values()
+    ])
+    # Keep existing values where the scrape came back empty
+    updated_values = {
+        "name": stmt.excluded.name,
+        "brand": func.coalesce(stmt.excluded.brand, Product.brand),
+        "size": func.coalesce(stmt.excluded.size, Product.size),
+        "url": stmt.excluded.url,
+        "base_product_id": func.coalesce(stmt.excluded.base_product_id, Product.base_product_id),
+        "variant_name": func.coalesce(stmt.excluded.variant_name, Product.variant_name),
+    }
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.external_id],
+        set_={**updated_values, "updated_at": utcnow()},
+        # Only rewrite rows where something changed
+        where=or_(*(
+            getattr(Product, column).is_distinct_from(value)
+            for column, value in updated_values.items()
+        ))
+    )
+    if is_postgres:
+        stmt = stmt.returning(Product.id, Product.external_id, literal_column("xmax = 0").label("inserted"))
+    else:
+        stmt = stmt.returning(Product.id, Product.external_id)
+
+    saved = {}
+    for row in session.execute(stmt):
+        product_id, external_id = row.id, row.external_id
+        is_new = row.inserted if is_postgres else external_id not in existing_ids
+        saved[external_id] = (product_id, is_new)
+        if is_new:
+            scraped = by_external_id[external_id]
+            logger.info(f"New product: {scraped.name} (variant: {scraped.variant_name})")
+
+    # Unchanged rows were skipped by the conflict WHERE and are not in RETURNING;
+    # their ids come from the pre-SELECT, or (on Postgres) one follow-up SELECT
+    unchanged = by_external_id.keys() - saved.keys()
+    for external_id in unchanged & existing_ids.keys():
+        saved[external_id] = (existing_ids[external_id], False)
+    unchanged -= existing_ids.keys()
+    if unchanged:
+        for product_id, external_id in session.execute(
+            select(Product.id, Product.external_id).where(Product.external_id.in_(unchanged))
+        ):
+            saved[external_id] = (product_id, False)
+
+    return saved
+
+
+def save_prices_bulk(rows: list[tuple[int, ScrapedProduct]], session) -> list[int]:
+    """
+    Record price points for many products with a single INSERT ... RETURNING.
+    recorded_at is computed by the database. Does not commit.
+    Takes (product_id, scraped) pairs; returns price_ids in the same order.
+    """
+    if not rows:
+        return []
 
-def get_historical_average(product_id: int, days: int = 30, session=None) -> Optional[float]:
-    """Get the average price for a product over the last N days."""
+    # insertmanyvalues sends this as one (or a few paged) multi-row INSERT ... RETURNING.
+    # Core table insert so recorded_at is rendered as SQL in every row, not bound per row.
+    stmt = insert(PriceHistory.__table__).values(recorded_at=utcnow()).returning(
+        PriceHistory.id, sort_by_parameter_order=True
+    )
+    return session.scalars(
+        stmt,
+        [
+            {
+                "product_id": product_id,
+                "current_price": scraped.current_price,
+                "original_price": scraped.original_price,
+                "is_on_sale": scraped.is_on_sale,
+                "sale_tag": scraped.sale_tag,
+                "original_price_per_kg": scraped.original_price_per_kg,
+                "reduced_price_per_kg": scraped.reduced_price_per_kg,
+                "effective_price_per_kg": (
+                    scraped.reduced_price_per_kg if scraped.reduced_price_per_kg is not None
+                    else scraped.original_price_per_kg
+                ),
+            }
+            for product_id, scraped in rows
+        ]
+    ).all()
+
+
+def get_historical_averages(product_ids: list[int], days: int = 30, session=None, now: Optional[datetime] = None) -> dict[int, float]:
+    """Get the average price over the last N days (before `now`) for many products in one query.
+
+    Returns {product_id: average_price} for products that have price history.
+    """
     close_session = False
     if not session:
-        session = get_session()
+        session = SessionLocal()
         close_session = True
-        
+
     try:
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        result = session.query(func.avg(PriceHistory.current_price)).filter(
-            PriceHistory.product_id == product_id,
-            PriceHistory.recorded_at >= cutoff
-        ).scalar()
+        cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+        rows = session.execute(
+            select(PriceHistory.product_id, func.avg(PriceHistory.current_price)).where(
+                PriceHistory.product_id.in_(product_ids),
+                PriceHistory.recorded_at >= cutoff
+            ).group_by(PriceHistory.product_id)
+        ).all()
 
-        return result
+        return {product_id: avg_price for product_id, avg_price in rows}
 
     finally:
         if close_session:
             session.close()
 
 
-def check_for_price_drop(product: Product, price: PriceHistory, session=None) -> bool:
-    """Check if the current price is lower than historical average."""
-    avg_price = get_historical_average(product.id, session=session)
-
+def check_for_price_drop(scraped: ScrapedProduct, avg_price: Optional[float]) -> bool:
+    """Check if the scraped price is lower than the (precomputed) historical average."""
     if not avg_price:
         # No historical data yet
         return False
 
-    drop_percent = ((avg_price - price.current_price) / avg_price) * 100
+    drop_percent = ((avg_price - scraped.current_price) / avg_price) * 100
 
     if drop_percent > 0:
         logger.info(
-            f"Price drop detected for {product.name}: "
-            f"{price.current_price}€ vs avg {avg_price:.2f}€ ({drop_percent:.1f}% off)"
+            f"Price drop detected for {scraped.name}: "
+            f"{scraped.current_price}€ vs avg {avg_price:.2f}€ ({drop_percent:.1f}% off)"
         )
         return True
 
     return False
 
 
-def check_under_max_price(product: Product, price: PriceHistory, chat_id: str) -> bool:
-    """Check if product is under user's max price threshold and from a watched brand."""
-    prefs = get_or_create_preferences(chat_id)
-
-    # Must have max price set
-    if prefs.max_price_per_kg is None:
-        return False
-
-    # Must be from a watched brand
-    if not prefs.should_notify_for_brand(product.brand):
-        return False
-
-    # Calculate price per kg - use reduced if available, otherwise calculate from current price
-    price_per_kg = price.reduced_price_per_kg
-    if price_per_kg is None and price.original_price_per_kg is not None:
-        # If there's a discount, calculate the reduced price per kg
-        if price.discount_percent > 0 and price.discount_percent < 100:
-            price_per_kg = round(price.original_price_per_kg * (1 - price.discount_percent / 100), 2)
-        else:
-            price_per_kg = price.original_price_per_kg
-
-    if price_per_kg is None:
-        return False
+def should_alert_for(scraped: ScrapedProduct, avg_price: Optional[float]) -> bool:
+    """Check if a freshly saved price is an alert candidate (checked against each user later)."""
+    # Product has a price per kg (could be under someone's threshold)
+    if (scraped.reduced_price_per_kg or scraped.original_price_per_kg) is not None:
+        return True
 
-    # Check if under threshold
-    if price_per_kg <= prefs.max_price_per_kg:
-        logger.info(
-            f"Good price found for {product.name}: "
-            f"{price_per_kg:.2f}€/kg <= {prefs.max_price_per_kg:.2f}€/kg threshold"
-        )
+    # Explicitly on sale with any discount
+    if scraped.is_on_sale and compute_discount_percent(scraped.original_price, scraped.current_price) > 0:
         return True
 
-    return False
+    # Price dropped compared to historical average
+    return check_for_price_drop(scraped, avg_price)
 
 
-async def process_products(products: list[ScrapedProduct]) -> dict:
-    """Process scraped products, save to DB, and send alerts."""
-    from services.alert_service import send_alerts_grouped
+async def save_products(products: list[ScrapedProduct], session=None) -> tuple[dict, list]:
+    """Save scraped products to DB. Returns (stats_dict, list_of_alert_tuples).
 
+    Batches are committed through `session` when given (an AsyncSession reused across chunks).
+    """
     stats = {
         "total": len(products),
         "new_products": 0,
@@ -198,105 +234,97 @@ async def process_products(products: list[ScrapedProduct]) -> dict:
         "on_sale": 0
     }
 
-    # Run the heavy synchronous DB operations in a separate thread
-    batch_stats, products_to_alert = await asyncio.to_thread(_save_products_batch_sync, products)
-    
-    # Merge stats
-    stats["new_products"] = batch_stats["new_products"]
-    stats["price_updates"] = batch_stats["price_updates"]
-    stats["on_sale"] = batch_stats["on_sale"]
+    # Save through the async engine (no thread hop),
+    # in fixed-size batches so large chunks don't hold every ORM object at once
+    products_to_alert = []
+    for start in range(0, len(products), SAVE_BATCH_SIZE):
+        batch = products[start:start + SAVE_BATCH_SIZE]
+        batch_stats, batch_alerts = await _save_products_batch(batch, session=session)
 
-    # Send alerts grouped by base_product_id + price
-    if products_to_alert:
-        alerts_count = await send_alerts_grouped(products_to_alert)
-        stats["alerts_sent"] = alerts_count
+        # Merge stats
+        stats["new_products"] += batch_stats["new_products"]
+        stats["price_updates"] += batch_stats["price_updates"]
+        stats["on_sale"] += batch_stats["on_sale"]
+        products_to_alert.extend(batch_alerts)
 
-    return stats
+    return stats, products_to_alert
 
 
-def _save_products_batch_sync(products: list[ScrapedProduct]) -> tuple[dict, list]:
+def _save_products_in_session(session, products: list[ScrapedProduct]) -> tuple[dict, list]:
     """
-    Synchronous function to save a batch of products to DB.
-    Should be run in a separate thread to avoid blocking the event loop.
+    Save a batch of products using the given (sync) session. Does not commit.
     Returns (stats_dict, list_of_alert_tuples).
     """
-    stats = {
-        "new_products": 0,
-        "price_updates": 0,
-        "on_sale": 0
-    }
-    products_to_alert = []
+    # One timestamp for the averages cutoff of the whole batch
+    now = datetime.utcnow()
 
-    # Use a single session for all processing
-    session = get_session()
-    try:
-        for scraped in products:
-            try:
-                # Save product and get its ID (using shared session)
-                product_id, is_new = save_product(scraped, session=session)
-                if is_new:
-                    stats["new_products"] += 1
-
-                # Save price and get its ID (using shared session)
-                price_id = save_price(product_id, scraped, session=session)
-                stats["price_updates"] += 1
-
-                if scraped.is_on_sale:
-                    stats["on_sale"] += 1
-
-                # Determine if we should alert
-                # We need to query specific objects to ensure they are attached to session
-                fresh_price = session.query(PriceHistory).get(price_id)
-                fresh_product = session.query(Product).get(product_id)
-
-                if not fresh_product or not fresh_price:
-                    continue
+    # Upsert all products, then insert all prices (one statement each)
+    saved_products = save_products_bulk(products, session)
 
-                should_alert = False
+    # Historical averages for all products in the batch, fetched before inserting new prices
+    avg_by_product_id = get_historical_averages(
+        [product_id for product_id, _ in saved_products.values()], session=session, now=now
+    )
 
-                # Alert if explicitly on sale with any discount
-                if fresh_price.is_on_sale and fresh_price.discount_percent > 0:
-                    should_alert = True
+    product_ids = [saved_products[scraped.external_id][0] for scraped in products]
+    price_ids = save_prices_bulk(list(zip(product_ids, products)), session)
 
-                # Also alert if price dropped compared to historical average
-                if not should_alert and check_for_price_drop(fresh_product, fresh_price, session=session):
-                    should_alert = True
+    stats = {
+        "new_products": sum(1 for _, is_new in saved_products.values() if is_new),
+        "price_updates": len(price_ids),
+        "on_sale": sum(1 for scraped in products if scraped.is_on_sale)
+    }
 
-                # Also alert if product has a price per kg (could be under someone's threshold)
-                price_per_kg = fresh_price.reduced_price_per_kg or fresh_price.original_price_per_kg
-                if not should_alert and price_per_kg is not None:
-                    should_alert = True
+    # Collect for grouped sending instead of sending immediately
+    products_to_alert = [
+        (product_id, price_id)
+        for scraped, product_id, price_id in zip(products, product_ids, price_ids)
+        if should_alert_for(scraped, avg_by_product_id.get(product_id))
+    ]
 
-                if should_alert:
-                    # Collect for grouped sending instead of sending immediately
-                    products_to_alert.append((fresh_product.id, fresh_price.id))
+    return stats, products_to_alert
 
-                # Commit each product individually to avoid losing all progress on a single failure
-                session.commit()
 
-            except Exception as e:
-                logger.error(f"Error processing product {scraped.name}: {e}")
-                session.rollback()
-                # Continue with next product instead of losing all previous work
-        
-    finally:
-        session.close()
+async def _save_products_batch(products: list[ScrapedProduct], session=None) -> tuple[dict, list]:
+    """
+    Save a batch of products in a single transaction on the async engine.
+    Uses `session` when given (it is left open), otherwise a new AsyncSession.
+    Returns (stats_dict, list_of_alert_tuples); nothing is saved if the batch fails.
+    """
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await _save_products_batch(products, session=session)
 
-    return stats, products_to_alert
+    try:
+        # The sync helpers run on the async connection; I/O is awaited on the event loop
+        stats, products_to_alert = await session.run_sync(_save_products_in_session, products)
+        # Commit per batch: alerts for it are sent (and read back) in a separate session
+        await session.commit()
+        return stats, products_to_alert
+    except Exception as e:
+        logger.error(f"Error saving batch of {len(products)} products: {e}")
+        await session.rollback()
+        return {"new_products": 0, "price_updates": 0, "on_sale": 0}, []
 
 
 async def run_check():
-    """Run a full price check cycle."""
-    global _is_running, _last_run_start
-    _is_running = True
-    _last_run_start = datetime.utcnow()
-    
-    try:
+    """Run a full price check cycle. Returns None if a check is already running."""
+    global _last_run_start
+    if _run_lock.locked():
+        logger.info("Price check already running, skipping")
+        return None
+
+    async with _run_lock:
+        _last_run_start = datetime.utcnow()
         logger.info("Starting price check...")
 
         # Initialize database
         init_db()
 
+        # Open an async connection now so the first chunk doesn't pay the connect cost
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
         # Fixed scraping parameters: All brands, up to 10€/kg
         # This decouples scraping from user settings
         logger.info("Scraping ALL brands up to 10.00€/kg")
@@ -309,27 +337,74 @@ async def run_check():
             "alerts_sent": 0
         }
 
-        async def handle_chunk(products: list[ScrapedProduct]):
+        # Alert sends still in flight; each chunk's alerts go out while the next chunk is saved
+        alert_tasks: set[asyncio.Task] = set()
+
+        async def send_chunk_alerts(products_to_alert: list[tuple[int, int]]):
+            try:
+                alerts_count = await send_alerts_grouped(products_to_alert)
+            except Exception as e:
+                logger.error(f"Error sending alerts for {len(products_to_alert)} products: {e}")
+                return
+            total_stats["alerts_sent"] += alerts_count
+            logger.info(f"Sent {alerts_count} new alerts for {len(products_to_alert)} candidates")
+
+        async def handle_chunk(products: list[ScrapedProduct], session=None):
             """Process a chunk of products immediately."""
             if not products:
                 return
             
-            chunk_stats = await process_products(products)
+            chunk_stats, products_to_alert = await save_products(products, session=session)
             
             # Update total stats
             total_stats["total"] += chunk_stats["total"]
             total_stats["new_products"] += chunk_stats["new_products"]
             total_stats["on_sale"] += chunk_stats["on_sale"]
-            total_stats["alerts_sent"] += chunk_stats["alerts_sent"]
             
-            logger.info(f"Processed chunk: {chunk_stats['total']} products, {chunk_stats['alerts_sent']} new alerts")
-
-        # Scrape products with streaming callback
-        await scrape_all_async(
-            watched_brands=None,  # None = scrape all quality brands
-            max_price_per_kg=10.0,
-            on_chunk_callback=handle_chunk
-        )
+            logger.info(f"Processed chunk: {chunk_stats['total']} products, {len(products_to_alert)} alert candidates")
+
+            # One grouped send per chunk (keeps cheapest-variant grouping), in the background
+            if products_to_alert:
+                task = asyncio.create_task(send_chunk_alerts(products_to_alert))
+                alert_tasks.add(task)
+                task.add_done_callback(alert_tasks.discard)
+
+        # Scrapers hand chunks to a bounded queue and keep scraping while
+        # consumers save them, so scrape and DB work overlap
+        chunk_queue: asyncio.Queue[list[ScrapedProduct]] = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+
+        async def enqueue_chunk(products: list[ScrapedProduct]):
+            if products:
+                await chunk_queue.put(products)
+
+        async def consume_chunks():
+            # One session per consumer for the whole check (sessions can't be shared between tasks)
+            async with AsyncSessionLocal() as session:
+                while True:
+                    products = await chunk_queue.get()
+                    try:
+                        await handle_chunk(products, session=session)
+                    except Exception as e:
+                        logger.error(f"Error processing chunk of {len(products)} products: {e}")
+                    finally:
+                        chunk_queue.task_done()
+
+        consumers = [asyncio.create_task(consume_chunks()) for _ in range(CHUNK_CONSUMERS)]
+        try:
+            # Scrape products with streaming callback
+            await scrape_all_async(
+                watched_brands=None,  # None = scrape all quality brands
+                max_price_per_kg=10.0,
+                on_chunk_callback=enqueue_chunk
+            )
+            # Wait for the remaining queued chunks
+            await chunk_queue.join()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            # Let in-flight alerts finish (and be recorded) before the check ends
+            await asyncio.gather(*alert_tasks, return_exceptions=True)
 
         logger.info(
             f"Check complete: {total_stats['total']} products, "
@@ -338,34 +413,42 @@ async def run_check():
         )
 
         return total_stats
-    finally:
-        _is_running = False
 
 
 def cleanup_old_offers(days_retention: int = 7) -> int:
     """Delete PriceHistory records older than N days."""
-    session = get_session()
-    try:
-        cutoff = datetime.utcnow() - timedelta(days=days_retention)
-        deleted_count = session.query(PriceHistory).filter(
-            PriceHistory.recorded_at < cutoff
-        ).delete()
-        session.commit()
-        if deleted_count > 0:
-            logger.info(f"Cleanup: Deleted {deleted_count} old price records (< {cutoff.date()})")
-        return deleted_count
-    except Exception as e:
-        logger.error(f"Cleanup failed: {e}")
-        session.rollback()
-        return 0
-    finally:
-        session.close()
+    with SessionLocal() as session:
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=days_retention)
+            # Bulk DELETE; no objects are loaded, so skip session synchronization
+            result = session.execute(
+                delete(PriceHistory).where(
+                    PriceHistory.recorded_at < cutoff
+                ).execution_options(synchronize_session=False)
+            )
+            deleted_count = result.rowcount
+            session.commit()
+            if deleted_count > 0:
+                logger.info(f"Cleanup: Deleted {deleted_count} old price records (< {cutoff.date()})")
+            return deleted_count
+        except Exception as e:
+            logger.error(f"Cleanup failed: {e}")
+            session.rollback()
+            return 0
 
 
 
 def run_check_sync():
     """Synchronous wrapper for run_check."""
-    return asyncio.run(run_check())
+    async def _run():
+        try:
+            return await run_check()
+        finally:
+            await shutdown_bot()
+            await shutdown_browser()
+            await async_engine.dispose()
+
+    return asyncio.run(_run())
 
 
 if __name__ == "__main__":